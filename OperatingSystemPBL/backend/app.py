@@ -8,22 +8,32 @@ import sqlite3
 import hashlib
 import gzip
 import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
 from datetime import datetime
 from math import ceil
 from flask_cors import cross_origin
 # Additional libraries for file conversion
-import whisper
 import pdfplumber
 from docx import Document
 
-from sentence_transformers import SentenceTransformer, util
-import torch
+from buddy import BuddyAllocator
+from inference import InferenceUnavailable, RemoteModels, load_models
+from search import EmbeddingIndex, fts_query, reciprocal_rank_fusion, to_blob, from_blob
+
+import numpy as np
 
 doc = Document()
 
-# model = SentenceTransformer("all-MiniLM-L6-v2")
-model = SentenceTransformer('all-MiniLM-L6-v2')  # your embedding model
-whisper_model = whisper.load_model("base")       # for MP3 transcription
+# With INFERENCE_ADDRESS set, models live in the shared inference worker (inference.py)
+# instead of being loaded again in every web worker.
+INFERENCE_ADDRESS = os.environ.get("INFERENCE_ADDRESS")
+if INFERENCE_ADDRESS:
+    model = whisper_model = RemoteModels(INFERENCE_ADDRESS)
+else:
+    model, whisper_model = load_models()
 
 
 app = Flask(__name__)
@@ -44,19 +54,46 @@ DB_FILE = "database.db"
 TOTAL_BLOCKS = 1000
 BLOCK_SIZE_KB = 4  # 4KB
 JUNK_EXTENSIONS = ['.tmp', '.log', '.bak', '.cache']
+SEARCH_BACKFILL_INTERVAL = 30  # seconds between search index backfill passes, if no upload wakes it first
+SEARCH_BACKFILL_LEASE = 300    # seconds a worker may hold the backfill before another takes over
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 
 
 # ---------- DB HELPERS ----------
 def get_conn():
-    conn = sqlite3.connect(DB_FILE, check_same_thread=False)
+    # generous timeout: with several workers, writers queue on SQLite's lock
+    conn = sqlite3.connect(DB_FILE, check_same_thread=False, timeout=30)
     conn.row_factory = sqlite3.Row
     return conn
 
+@contextmanager
+def allocation_lock():
+    """
+    Transaction holding SQLite's write lock from the start (BEGIN IMMEDIATE).
+    Every change to block ownership runs inside one, so finding free blocks and
+    occupying them is atomic across threads and worker processes.
+    """
+    global buddy_generation
+    conn = get_conn()
+    conn.isolation_level = None
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        # the in-memory buddy free lists may hold changes that were just rolled back
+        buddy_generation = None
+        raise
+    finally:
+        conn.close()
+
 def init_db():
     conn = get_conn()
     c = conn.cursor()
+    # WAL lets readers (/files, /blocks) run while a worker holds the write lock
+    c.execute("PRAGMA journal_mode=WAL")
     # files: metadata + hash, compression
     c.execute("""
     CREATE TABLE IF NOT EXISTS files (
@@ -78,6 +115,45 @@ def init_db():
         next_block INTEGER,
         FOREIGN KEY(file_id) REFERENCES files(id)
     )""")
+    # buddy allocations: the power-of-two block a buddy file owns
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS buddy_allocations (
+        file_id INTEGER PRIMARY KEY,
+        start_block INTEGER,
+        block_order INTEGER,
+        used_blocks INTEGER,
+        FOREIGN KEY(file_id) REFERENCES files(id)
+    )""")
+    # generation counters, bumped on every change so workers know their in-memory state is stale
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS state_generations (
+        name TEXT PRIMARY KEY,
+        generation INTEGER
+    )""")
+    # search index: extracted text (rowid = file id) and cached embeddings
+    c.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS file_text USING fts5(filename, content)
+    """)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS file_embeddings (
+        file_id INTEGER PRIMARY KEY,
+        embedding BLOB,
+        FOREIGN KEY(file_id) REFERENCES files(id)
+    )""")
+    # search index changes, replayed by each worker onto its in-memory embedding matrix
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS search_log (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_id INTEGER,
+        op TEXT
+    )""")
+    # leases: background jobs that only one worker at a time should run
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS leases (
+        name TEXT PRIMARY KEY,
+        owner INTEGER,
+        expires_at REAL
+    )""")
     # logs / journal
     c.execute("""
     CREATE TABLE IF NOT EXISTS logs (
@@ -138,7 +214,7 @@ def ensure_blocks_table_populated():
             existing.add(r['block_index'])
         for i in range(TOTAL_BLOCKS):
             if i not in existing:
-                c.execute("INSERT OR REPLACE INTO blocks (block_index, file_id, next_block) VALUES (?, ?, ?)", (i, None, None))
+                c.execute("INSERT OR IGNORE INTO blocks (block_index, file_id, next_block) VALUES (?, ?, ?)", (i, None, None))
         conn.commit()
     conn.close()
 
@@ -166,8 +242,7 @@ def fragmentation_percent():
     return (fragments / TOTAL_BLOCKS) * 100.0
 
 # ---------- ALLOCATION HELPERS ----------
-def find_contiguous(num_blocks):
-    conn = get_conn()
+def find_contiguous(num_blocks, conn):
     c = conn.cursor()
     # scan blocks table for contiguous sequence of free blocks
     c.execute("SELECT block_index, file_id FROM blocks ORDER BY block_index")
@@ -182,34 +257,293 @@ def find_contiguous(num_blocks):
             else:
                 length += 1
             if length >= num_blocks:
-                conn.close()
                 return start
         else:
             start = None
             length = 0
-    conn.close()
     return -1
 
-def find_free_blocks_any(num_blocks):
-    conn = get_conn()
+def find_free_blocks_any(num_blocks, conn):
     c = conn.cursor()
     c.execute("SELECT block_index FROM blocks WHERE file_id IS NULL ORDER BY block_index LIMIT ?", (num_blocks,))
     rows = [r['block_index'] for r in c.fetchall()]
-    conn.close()
     return rows if len(rows) == num_blocks else []
 
-def occupy_blocks(file_id, blocks_list):
-    conn = get_conn()
+def occupy_blocks(file_id, blocks_list, conn):
     c = conn.cursor()
     # mark blocks assigned and set next pointers
     for i, b in enumerate(blocks_list):
         next_b = blocks_list[i+1] if i+1 < len(blocks_list) else None
         c.execute("UPDATE blocks SET file_id = ?, next_block = ? WHERE block_index = ?", (file_id, next_b, b))
+
+def read_generation(conn, name):
+    row = conn.execute("SELECT generation FROM state_generations WHERE name = ?", (name,)).fetchone()
+    return row['generation'] if row else 0
+
+def bump_generation(conn, name):
+    conn.execute("""
+        INSERT INTO state_generations (name, generation) VALUES (?, 1)
+        ON CONFLICT(name) DO UPDATE SET generation = generation + 1
+    """, (name,))
+    return read_generation(conn, name)
+
+def claim_lease(name, seconds):
+    """Take, or extend, a lease shared by all workers. Returns True if this process holds it."""
+    conn = get_conn()
+    c = conn.cursor()
+    now = time.time()
+    c.execute("""
+        INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?)
+        ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+        WHERE leases.owner = excluded.owner OR leases.expires_at < ?
+    """, (name, os.getpid(), now + seconds, now))
+    held = c.rowcount == 1
+    conn.commit()
+    conn.close()
+    return held
+
+def release_lease(name):
+    conn = get_conn()
+    conn.execute("UPDATE leases SET expires_at = 0 WHERE name = ? AND owner = ?", (name, os.getpid()))
+    conn.commit()
+    conn.close()
+
+# ---------- BUDDY ALLOCATOR ----------
+# In-memory free lists, rebuilt from the blocks table whenever another
+# strategy, worker, delete, defrag or reset has changed block ownership
+# (i.e. the "blocks" generation moved past the one they were built at).
+# Only call these inside allocation_lock().
+buddy_allocator = None
+buddy_generation = None
+
+def get_buddy_allocator(conn):
+    global buddy_allocator, buddy_generation
+    generation = read_generation(conn, "blocks")
+    if buddy_allocator is None or buddy_generation != generation:
+        c = conn.cursor()
+        c.execute("SELECT block_index, file_id FROM blocks ORDER BY block_index")
+        free_mask = [True] * TOTAL_BLOCKS
+        for r in c.fetchall():
+            if r['file_id'] is not None and r['block_index'] < TOTAL_BLOCKS:
+                free_mask[r['block_index']] = False
+        buddy_allocator = BuddyAllocator(TOTAL_BLOCKS, free_mask)
+        buddy_generation = generation
+    return buddy_allocator
+
+def blocks_changed(conn, buddy_in_sync=False):
+    """Record a change to block ownership. Pass buddy_in_sync when the in-memory allocator already reflects it."""
+    global buddy_generation
+    generation = bump_generation(conn, "blocks")
+    if buddy_in_sync:
+        buddy_generation = generation
+
+def internal_fragmentation():
+    """Blocks reserved by buddy allocations beyond what their files actually use."""
+    conn = get_conn()
+    c = conn.cursor()
+    c.execute("SELECT COALESCE(SUM(1 << block_order), 0) AS reserved, COALESCE(SUM(used_blocks), 0) AS used FROM buddy_allocations")
+    row = c.fetchone()
+    conn.close()
+    wasted = row['reserved'] - row['used']
+    return {
+        "wasted_blocks": wasted,
+        "percent": (wasted / row['reserved']) * 100.0 if row['reserved'] else 0.0
+    }
+
+
+
+# ---------- SEARCH INDEX ----------
+# Text is extracted and encoded once, by the backfill thread shortly after upload;
+# /search and /optimize only read the index. Each worker keeps its own embedding matrix and catches
+# up by replaying search_log.
+embedding_index = None
+search_seq = 0
+embedding_lock = threading.Lock()
+search_backfill_thread = None
+search_backfill_wakeup = threading.Event()  # set by /upload
+
+def mp3_to_text(path):
+    result = whisper_model.transcribe(path)
+    return result['text']
+
+def pdf_to_text(path):
+    content = ""
+    with pdfplumber.open(path) as pdf:
+        for page in pdf.pages:
+            content += page.extract_text() or ""
+    return content
+
+def docx_to_text(path):
+    import docx
+    doc = docx.Document(path)
+    return "\n".join([p.text for p in doc.paragraphs])
+
+def extract_text(path, filename):
+    ext = os.path.splitext(filename)[1].lower()
+    if ext in [".txt", ".srt", ".vtt"]:
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            return f.read()
+    elif ext == ".mp3":
+        return mp3_to_text(path)
+    elif ext == ".pdf":
+        return pdf_to_text(path)
+    elif ext == ".docx":
+        return docx_to_text(path)
+    elif ext in [".png", ".jpg", ".jpeg"]:
+        return f"[IMAGE FILE: {filename}]"
+    print(f"Unsupported file type: {filename}")
+    return ""
+
+def get_embedding_index():
+    global embedding_index, search_seq
+    with embedding_lock:
+        conn = get_conn()
+        conn.isolation_level = None
+        # one read snapshot, so the log position matches the rows loaded
+        conn.execute("BEGIN")
+        c = conn.cursor()
+        if embedding_index is None:
+            embedding_index = EmbeddingIndex()
+            c.execute("SELECT COALESCE(MAX(seq), 0) AS seq FROM search_log")
+            search_seq = c.fetchone()['seq']
+            c.execute("SELECT file_id, embedding FROM file_embeddings")
+            for r in c.fetchall():
+                embedding_index.add(r['file_id'], from_blob(r['embedding']))
+        else:
+            c.execute("""
+                SELECT l.seq, l.file_id, l.op, e.embedding FROM search_log l
+                LEFT JOIN file_embeddings e ON e.file_id = l.file_id
+                WHERE l.seq > ? ORDER BY l.seq
+            """, (search_seq,))
+            for r in c.fetchall():
+                if r['op'] == 'reset':
+                    embedding_index = EmbeddingIndex()
+                elif r['op'] == 'remove':
+                    embedding_index.remove(r['file_id'])
+                elif r['embedding'] is not None:
+                    # no embedding: the file was removed later in the log
+                    embedding_index.add(r['file_id'], from_blob(r['embedding']))
+                search_seq = r['seq']
+        conn.execute("COMMIT")
+        conn.close()
+        return embedding_index
+
+def index_file(file_id, filename, path):
+    """
+    Extract a file's text into the keyword index, then encode it for semantic
+    search. Keyword search must not depend on the inference worker: if it is
+    unreachable only the embedding is deferred (the text too for an MP3, which
+    needs Whisper), and a later backfill_search_index() pass picks it up.
+    """
+    try:
+        content = extract_text(path, filename)
+    except InferenceUnavailable as e:
+        print(f"Deferred indexing of {filename}: {e}")
+        return
+    except Exception as e:
+        print(f"Failed to process {filename}: {e}")
+        content = ""
+
+    conn = get_conn()
+    c = conn.cursor()
+    c.execute("DELETE FROM file_text WHERE rowid = ?", (file_id,))
+    # the file may have been deleted since upload; its unindex_file() already ran
+    c.execute("""
+        INSERT INTO file_text (rowid, filename, content)
+        SELECT ?, ?, ? WHERE EXISTS (SELECT 1 FROM files WHERE id = ?)
+    """, (file_id, filename, content, file_id))
     conn.commit()
     conn.close()
 
+    try:
+        embed_file(file_id, content)
+    except InferenceUnavailable as e:
+        print(f"Deferred embedding of {filename}: {e}")
+    except Exception as e:
+        print(f"Failed to encode {filename}: {e}")
 
+def embed_file(file_id, content):
+    """Encode extracted text and cache the embedding. Raises InferenceUnavailable if the worker is down."""
+    if not content.strip():
+        return
+    vector = model.encode(content, normalize_embeddings=True)
+    conn = get_conn()
+    c = conn.cursor()
+    c.execute("""
+        INSERT OR REPLACE INTO file_embeddings (file_id, embedding)
+        SELECT ?, ? WHERE EXISTS (SELECT 1 FROM files WHERE id = ?)
+    """, (file_id, to_blob(vector), file_id))
+    if c.rowcount:
+        c.execute("INSERT INTO search_log (file_id, op) VALUES (?, 'add')", (file_id,))
+    conn.commit()
+    conn.close()
 
+def unindex_file(file_id, conn):
+    """Drop a file from the search index. Call in the transaction that deletes the file."""
+    c = conn.cursor()
+    c.execute("DELETE FROM file_text WHERE rowid = ?", (file_id,))
+    c.execute("DELETE FROM file_embeddings WHERE file_id = ?", (file_id,))
+    c.execute("INSERT INTO search_log (file_id, op) VALUES (?, 'remove')", (file_id,))
+
+def backfill_search_index():
+    """
+    Index every file the search index is missing: new uploads, text that was
+    extracted but never encoded, and files uploaded before the index existed.
+    Runs on the backfill thread, never in a request; a lease keeps workers from
+    extracting the same files at once. Keeps going until nothing new is left, so
+    uploads that land while another worker holds the lease are not left waiting.
+    """
+    if not claim_lease("search_backfill", SEARCH_BACKFILL_LEASE):
+        return
+    attempted = set()  # files that fail stay missing; try each once per pass
+    try:
+        while True:
+            conn = get_conn()
+            c = conn.cursor()
+            c.execute("""
+                SELECT rowid AS id, content FROM file_text
+                WHERE rowid NOT IN (SELECT file_id FROM file_embeddings) AND trim(content) != ''
+            """)
+            unembedded = [r for r in c.fetchall() if r['id'] not in attempted]
+            c.execute("SELECT id, filename, stored_filename FROM files WHERE id NOT IN (SELECT rowid FROM file_text)")
+            unextracted = [r for r in c.fetchall() if r['id'] not in attempted]
+            conn.close()
+            if not unembedded and not unextracted:
+                return
+            for r in unembedded:
+                attempted.add(r['id'])
+                try:
+                    embed_file(r['id'], r['content'])
+                except InferenceUnavailable as e:
+                    print(f"Deferred embedding backfill: {e}")
+                    return
+                except Exception as e:
+                    print(f"Failed to encode file {r['id']}: {e}")
+                if not claim_lease("search_backfill", SEARCH_BACKFILL_LEASE):
+                    return
+            for r in unextracted:
+                attempted.add(r['id'])
+                index_file(r['id'], r['filename'], os.path.join(UPLOAD_DIR, r['stored_filename']))
+                if not claim_lease("search_backfill", SEARCH_BACKFILL_LEASE):
+                    return
+    finally:
+        release_lease("search_backfill")
+
+def search_backfill_loop():
+    while True:
+        try:
+            backfill_search_index()
+        except Exception as e:
+            print(f"Search index backfill failed: {e}")
+        search_backfill_wakeup.wait(SEARCH_BACKFILL_INTERVAL)
+        search_backfill_wakeup.clear()
+
+def start_search_backfill():
+    """Start the backfill thread for this process (see wsgi.py); safe to call more than once."""
+    global search_backfill_thread
+    if search_backfill_thread is None:
+        search_backfill_thread = threading.Thread(target=search_backfill_loop, daemon=True)
+        search_backfill_thread.start()
 
 @app.route("/delete/<int:file_id>", methods=["DELETE", "OPTIONS"])
 @cross_origin(origin='http://localhost:5173', methods=['DELETE', 'OPTIONS'])
@@ -218,19 +552,30 @@ def delete_file(file_id):
         return '', 200  # Handle preflight request for CORS
 
     try:
-        conn = get_conn()
-        c = conn.cursor()
-
-        # Get stored file name before deleting DB entry
-        c.execute("SELECT stored_filename FROM files WHERE id = ?", (file_id,))
-        row = c.fetchone()
-        stored_filename = row["stored_filename"] if row else None
-
-        # Delete file record and free its blocks
-        c.execute("DELETE FROM files WHERE id = ?", (file_id,))
-        c.execute("UPDATE blocks SET file_id = NULL, next_block = NULL WHERE file_id = ?", (file_id,))
-        conn.commit()
-        conn.close()
+        with allocation_lock() as conn:
+            c = conn.cursor()
+
+            # Get stored file name before deleting DB entry
+            c.execute("SELECT stored_filename FROM files WHERE id = ?", (file_id,))
+            row = c.fetchone()
+            stored_filename = row["stored_filename"] if row else None
+
+            c.execute("SELECT start_block, block_order FROM buddy_allocations WHERE file_id = ?", (file_id,))
+            buddy_row = c.fetchone()
+            # bring the free lists up to date while the file still owns its blocks;
+            # a rebuild after the UPDATE below would already count them as free
+            allocator = get_buddy_allocator(conn) if buddy_row else None
+
+            # Delete file record and free its blocks
+            c.execute("DELETE FROM files WHERE id = ?", (file_id,))
+            c.execute("DELETE FROM buddy_allocations WHERE file_id = ?", (file_id,))
+            c.execute("UPDATE blocks SET file_id = NULL, next_block = NULL WHERE file_id = ?", (file_id,))
+
+            # buddy blocks go back to the free lists and coalesce; anything else means a rebuild
+            if allocator is not None:
+                allocator.free(buddy_row["start_block"], buddy_row["block_order"])
+            blocks_changed(conn, buddy_in_sync=bool(buddy_row))
+            unindex_file(file_id, conn)
 
         # Remove actual file from uploads directory
         if stored_filename:
@@ -287,14 +632,27 @@ def get_files():
     return jsonify(files), 200
 
 
+def clear_filesystem(conn):
+    """Drop every file, allocation and search entry. Call inside allocation_lock()."""
+    c = conn.cursor()
+    c.execute("DELETE FROM files")
+    c.execute("DELETE FROM buddy_allocations")
+    c.execute("DELETE FROM file_text")
+    c.execute("DELETE FROM file_embeddings")
+    c.execute("INSERT INTO search_log (file_id, op) VALUES (NULL, 'reset')")
+    c.execute("UPDATE blocks SET file_id = NULL, next_block = NULL")
+    c.execute("DELETE FROM logs")
+    blocks_changed(conn)
+
+
 @app.route("/init", methods=["GET"])
 def reset_filesystem():
-    # delete existing DB
-    if os.path.exists(DB_FILE):
-        os.remove(DB_FILE)
-
-    # reinitialize tables
-    init_db()
+    # empty the existing DB in place rather than deleting the file,
+    # which other worker processes may still have open
+    with allocation_lock() as conn:
+        clear_filesystem(conn)
+        conn.execute("DELETE FROM ai_recommendations")
+        conn.execute("DELETE FROM sqlite_sequence WHERE name IN ('files', 'logs', 'ai_recommendations')")
 
     # repopulate block table so all blocks show as free
     ensure_blocks_table_populated()
@@ -385,9 +743,9 @@ def upload():
     if file.filename == "":
         return jsonify({"error": "No selected file"}), 400
 
-    # Secure filename & save
+    # Secure filename & save (the random part keeps concurrent same-name uploads apart)
     filename = secure_filename(file.filename)
-    stored_name = f"{int(datetime.utcnow().timestamp())}_{filename}"
+    stored_name = f"{int(datetime.utcnow().timestamp())}_{uuid.uuid4().hex[:8]}_{filename}"
     file_path = os.path.join(UPLOAD_DIR, stored_name)
     file.save(file_path)
 
@@ -399,36 +757,53 @@ def upload():
     num_blocks = max(1, math.ceil(size_kb / BLOCK_SIZE_KB))
 
     # -------- SELECT ALLOCATION STRATEGY --------
-    blocks_list = []
-    if allocation_type == "contiguous":
-        start = find_contiguous(num_blocks)
-        if start == -1:
-            return jsonify({"error": "Not enough contiguous space"}), 400
-        blocks_list = list(range(start, start + num_blocks))
-
-    elif allocation_type in ["linked", "indexed"]:
-        blocks_list = find_free_blocks_any(num_blocks)
-        if not blocks_list:
-            return jsonify({"error": "Not enough free blocks"}), 400
-
-    else:
-        return jsonify({"error": "Invalid allocation type"}), 400
-
-    # insert file record
-    conn = get_conn()
-    c = conn.cursor()
-    c.execute("""
-        INSERT INTO files (filename, stored_filename, size_kb, original_size_kb, uploaded_at, allocation_type, sha256)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    """, (filename, stored_name, size_kb, original_size_kb, datetime.utcnow().isoformat(), allocation_type, sha))
-    file_id = c.lastrowid
-    conn.commit()
-    conn.close()
+    # find + occupy + record run under one write lock, so concurrent uploads
+    # (threads or worker processes) never get the same blocks
+    with allocation_lock() as conn:
+        blocks_list = []
+        if allocation_type == "contiguous":
+            start = find_contiguous(num_blocks, conn)
+            if start == -1:
+                return jsonify({"error": "Not enough contiguous space"}), 400
+            blocks_list = list(range(start, start + num_blocks))
+
+        elif allocation_type in ["linked", "indexed"]:
+            blocks_list = find_free_blocks_any(num_blocks, conn)
+            if not blocks_list:
+                return jsonify({"error": "Not enough free blocks"}), 400
+
+        elif allocation_type == "buddy":
+            buddy_block = get_buddy_allocator(conn).allocate(num_blocks)
+            if buddy_block is None:
+                return jsonify({"error": "Not enough buddy space"}), 400
+            start, order = buddy_block
+            # the whole power-of-two block belongs to the file; the tail is internal fragmentation
+            blocks_list = list(range(start, start + (1 << order)))
 
-    # occupy blocks
-    occupy_blocks(file_id, blocks_list)
+        else:
+            return jsonify({"error": "Invalid allocation type"}), 400
 
-    add_log(f"Uploaded file '{filename}' using {allocation_type} allocation.")
+        # insert file record
+        c = conn.cursor()
+        c.execute("""
+            INSERT INTO files (filename, stored_filename, size_kb, original_size_kb, uploaded_at, allocation_type, sha256)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (filename, stored_name, size_kb, original_size_kb, datetime.utcnow().isoformat(), allocation_type, sha))
+        file_id = c.lastrowid
+        if allocation_type == "buddy":
+            c.execute("INSERT INTO buddy_allocations (file_id, start_block, block_order, used_blocks) VALUES (?, ?, ?, ?)",
+                      (file_id, start, order, num_blocks))
+
+        # occupy blocks
+        occupy_blocks(file_id, blocks_list, conn)
+        blocks_changed(conn, buddy_in_sync=allocation_type == "buddy")
+
+    # extraction and encoding (Whisper for MP3s) can outlast the worker timeout, and a
+    # committed upload that errors gets retried and stored twice: index it off the request
+    search_backfill_wakeup.set()
+
+    # id and block count let simulator.py replay the journal as a workload trace
+    add_log(f"Uploaded file '{filename}' (id {file_id}, {num_blocks} blocks) using {allocation_type} allocation.")
     return jsonify({"message": "File uploaded", "file_id": file_id, "blocks": blocks_list}), 200
 
 
@@ -508,90 +883,24 @@ def upload():
 
 @app.route('/optimize', methods=['POST'])
 def optimize():
+    # Embeddings are cached at upload time (or by the backfill thread); nothing is encoded here
     conn = get_conn()
     cur = conn.cursor()
+    cur.execute("SELECT id, filename FROM files")
+    names = {r['id']: r['filename'] for r in cur.fetchall()}
+    conn.close()
 
-    # Fetch all files
-    cur.execute("SELECT id, filename, stored_filename FROM files")
-    files = cur.fetchall()
-
-    if len(files) < 2:
+    if len(names) < 2:
         return {"message": "Not enough files to optimize"}, 200
 
-    contents = []
-    file_ids = []
-
-    # Helper functions
-    def mp3_to_text(path):
-        result = whisper_model.transcribe(path)
-        return result['text']
-
-    def pdf_to_text(path):
-        import pdfplumber
-        content = ""
-        with pdfplumber.open(path) as pdf:
-            for page in pdf.pages:
-                content += page.extract_text() or ""
-        return content
-
-    def docx_to_text(path):
-        import docx
-        doc = docx.Document(path)
-        return "\n".join([p.text for p in doc.paragraphs])
-
-    # Process files
-       # Process files
-    for file in files:
-        file_id = file['id']
-        filename = file['filename']
-        path = os.path.join(UPLOAD_DIR, file['stored_filename'])
-
-        try:
-            ext = os.path.splitext(filename)[1].lower()
-            content = ""
-
-            if ext == ".txt":
-                with open(path, "r", encoding="utf-8", errors="ignore") as f:
-                    content = f.read()
-
-            elif ext == ".mp3":
-                content = mp3_to_text(path)
-
-            elif ext == ".pdf":
-                content = pdf_to_text(path)
-
-            elif ext == ".docx":
-                content = docx_to_text(path)
-
-            # ✅ New: support for images and subtitles
-            elif ext in [".png", ".jpg", ".jpeg"]:
-                content = f"[IMAGE FILE: {filename}]"
-
-            elif ext in [".srt", ".vtt"]:
-                with open(path, "r", encoding="utf-8", errors="ignore") as f:
-                    content = f.read()
-
-            else:
-                print(f"Unsupported file type: {filename}")
-                continue
-
-            if content.strip() == "":
-                continue
-
-            contents.append(content)
-            file_ids.append((file_id, filename))
-
-        except Exception as e:
-            print(f"Failed to process {filename}: {e}")
-            continue
-
-
-    if not contents:
+    index = get_embedding_index()
+    file_ids = [fid for fid in index.ids if fid in names]
+    if not file_ids:
         return {"message": "No valid files to optimize"}, 200
 
-    # Generate embeddings and similarity
-    embeddings = model.encode(contents, convert_to_tensor=True)
-    similarity_matrix = util.cos_sim(embeddings, embeddings)
+    # Embeddings are normalised, so the dot product is the cosine similarity
+    embeddings = np.stack([index.matrix[index.pos[fid]] for fid in file_ids])
+    similarity_matrix = embeddings @ embeddings.T
 
     suggestions = []
     threshold = 0.80  # 80% similarity = potential duplicate
@@ -601,20 +910,98 @@ def optimize():
             score = float(similarity_matrix[i][j])
             if score >= threshold:
                 suggestions.append({
-                    "file1": file_ids[i][1],
-                    "file2": file_ids[j][1],
+                    "file1": names[file_ids[i]],
+                    "file2": names[file_ids[j]],
                     "similarity": round(score * 100, 2)
                 })
 
     return {"duplicates": suggestions}, 200
 
 
+@app.route("/search", methods=["GET"])
+def search():
+    """
+    Search stored files.
+     - q: query text
+     - mode: keyword (FTS5/BM25), semantic (MiniLM cosine) or hybrid (both, fused by rank)
+     - limit: max results (default 10)
+    """
+    q = request.args.get("q", "").strip()
+    mode = request.args.get("mode", "hybrid")
+    limit = min(request.args.get("limit", 10, type=int), 100)
+    if not q:
+        return jsonify({"error": "Missing query"}), 400
+    if limit < 1:
+        return jsonify({"error": "limit must be at least 1"}), 400
+    if mode not in ["keyword", "semantic", "hybrid"]:
+        return jsonify({"error": "Invalid search mode"}), 400
+
+    # fuse over a deeper candidate list than we return
+    depth = limit if mode != "hybrid" else max(limit * 5, 50)
+    keyword_hits = {}
+    semantic_hits = {}
+
+    conn = get_conn()
+    c = conn.cursor()
+    if mode in ["keyword", "hybrid"]:
+        match = fts_query(q)
+        if match:
+            c.execute("""
+                SELECT rowid, bm25(file_text) AS score, snippet(file_text, 1, '[', ']', '...', 12) AS snippet
+                FROM file_text WHERE file_text MATCH ? ORDER BY rank LIMIT ?
+            """, (match, depth))
+            for r in c.fetchall():
+                # bm25() is lower-is-better; flip it so every score is higher-is-better
+                keyword_hits[r["rowid"]] = {"score": -r["score"], "snippet": r["snippet"]}
+
+    if mode in ["semantic", "hybrid"]:
+        try:
+            query_vector = model.encode(q, normalize_embeddings=True)
+        except InferenceUnavailable as e:
+            conn.close()
+            return jsonify({"error": str(e)}), 503
+        for fid, score in get_embedding_index().top_k(query_vector, depth):
+            semantic_hits[fid] = score
+
+    if mode == "keyword":
+        ranked = [(fid, hit["score"]) for fid, hit in keyword_hits.items()]
+    elif mode == "semantic":
+        ranked = list(semantic_hits.items())
+    else:
+        ranked = reciprocal_rank_fusion(list(keyword_hits), list(semantic_hits))
+    ranked = ranked[:limit]
+
+    names = {}
+    if ranked:
+        ids = [fid for fid, _ in ranked]
+        c.execute(f"SELECT id, filename FROM files WHERE id IN ({','.join('?' * len(ids))})", ids)
+        names = {r["id"]: r["filename"] for r in c.fetchall()}
+    conn.close()
+
+    results = []
+    for fid, score in ranked:
+        if fid not in names:
+            continue
+        results.append({
+            "file_id": fid,
+            "filename": names[fid],
+            "score": round(score, 6),
+            "snippet": keyword_hits.get(fid, {}).get("snippet")
+        })
+    return jsonify({"query": q, "mode": mode, "results": results}), 200
+
+
 @app.route("/blocks", methods=["GET"])
 def get_blocks():
     conn = get_conn()
     c = conn.cursor()
     c.execute("SELECT block_index, file_id, next_block FROM blocks ORDER BY block_index")
     rows = c.fetchall()
+    # blocks past used_blocks in a buddy allocation hold no data
+    c.execute("SELECT start_block, used_blocks, block_order FROM buddy_allocations")
+    wasted = set()
+    for r in c.fetchall():
+        wasted.update(range(r["start_block"] + r["used_blocks"], r["start_block"] + (1 << r["block_order"])))
     conn.close()
 
     block_list = []
@@ -622,7 +1009,8 @@ def get_blocks():
         block_list.append({
             "block_index": r["block_index"],
             "file_id": r["file_id"],
-            "next_block": r["next_block"]
+            "next_block": r["next_block"],
+            "internal_fragment": r["block_index"] in wasted
         })
 
     return jsonify({"blocks": block_list}), 200
@@ -635,35 +1023,45 @@ def defragment():
     Simple defragment — collect files in upload order and reassign contiguous blocks.
     """
     ensure_blocks_table_populated()
-    conn = get_conn()
-    c = conn.cursor()
-    # clear all block allocations
-    c.execute("UPDATE blocks SET file_id = NULL, next_block = NULL")
-    conn.commit()
-
-    # get files ordered by id (upload order)
-    c.execute("SELECT id FROM files ORDER BY id")
-    files = [r['id'] for r in c.fetchall()]
+    with allocation_lock() as conn:
+        c = conn.cursor()
+        # clear all block allocations
+        c.execute("UPDATE blocks SET file_id = NULL, next_block = NULL")
 
-    current = 0
-    for fid in files:
-        # find how many blocks were used previously (we saved blocks_count maybe; compute from size)
-        c.execute("SELECT size_kb FROM files WHERE id = ?", (fid,))
-        row = c.fetchone()
-        if not row:
-            continue
-        size_kb = row['size_kb']
-        num_blocks = ceil(size_kb / BLOCK_SIZE_KB) or 1
-        blocks = list(range(current, current + num_blocks))
-        occupy_blocks(fid, blocks)
-        current += num_blocks
-    conn.commit()
-    conn.close()
+        # buddy files first, largest order first: packing descending powers of two
+        # from block 0 keeps every one of them aligned
+        c.execute("SELECT file_id, block_order FROM buddy_allocations ORDER BY block_order DESC, file_id")
+        current = 0
+        for r in c.fetchall():
+            size = 1 << r['block_order']
+            c.execute("UPDATE buddy_allocations SET start_block = ? WHERE file_id = ?", (current, r['file_id']))
+            occupy_blocks(r['file_id'], list(range(current, current + size)), conn)
+            current += size
+
+        # get remaining files ordered by id (upload order)
+        c.execute("SELECT id FROM files WHERE id NOT IN (SELECT file_id FROM buddy_allocations) ORDER BY id")
+        files = [r['id'] for r in c.fetchall()]
+
+        for fid in files:
+            # find how many blocks were used previously (we saved blocks_count maybe; compute from size)
+            c.execute("SELECT size_kb FROM files WHERE id = ?", (fid,))
+            row = c.fetchone()
+            if not row:
+                continue
+            size_kb = row['size_kb']
+            num_blocks = ceil(size_kb / BLOCK_SIZE_KB) or 1
+            blocks = list(range(current, current + num_blocks))
+            occupy_blocks(fid, blocks, conn)
+            current += num_blocks
+        blocks_changed(conn)
     add_log("Defragmentation complete")
 
 @app.route("/fragmentation", methods=["GET"])
 def get_fragmentation():
-    return jsonify({"fragmentation": fragmentation_percent()})
+    return jsonify({
+        "fragmentation": fragmentation_percent(),
+        "internal_fragmentation": internal_fragmentation()
+    })
 
 @app.route("/defragment", methods=["POST"])
 def defragment_endpoint():
@@ -711,13 +1109,8 @@ def reset_all():
     Warning: destroys data — useful for dev/testing
     """
     ensure_blocks_table_populated()
-    conn = get_conn()
-    c = conn.cursor()
-    c.execute("DELETE FROM files")
-    c.execute("UPDATE blocks SET file_id = NULL, next_block = NULL")
-    c.execute("DELETE FROM logs")
-    conn.commit()
-    conn.close()
+    with allocation_lock() as conn:
+        clear_filesystem(conn)
     # delete files on disk
     for fname in os.listdir(UPLOAD_DIR):
         try:
@@ -728,5 +1121,7 @@ def reset_all():
     return jsonify({"ok": True})
 
 # ---------- run ----------
+# Development server only. For multiple workers use wsgi.py (see its docstring).
 if __name__ == "__main__":
+    start_search_backfill()
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,82 @@
+# backend/bench_allocators.py
+"""
+Benchmark the buddy allocator against the existing strategies under churn.
+
+Part 1 replays synthetic churn traces at several fill levels through the
+simulator and compares failure rate and fragmentation of contiguous
+(first-fit), linked/indexed (lowest-index) and buddy allocation.
+
+Part 2 measures per-operation cost as the disk grows, to show buddy
+allocate/free staying O(log n) while the contiguous scan is O(n).
+
+Usage:
+    python bench_allocators.py
+"""
+import random
+import time
+
+from buddy import BuddyAllocator
+import simulator
+
+POLICIES = ["first-fit", "lowest-index", "buddy"]
+LABELS = {"first-fit": "contiguous", "lowest-index": "linked/indexed", "buddy": "buddy"}
+
+
+def churn_comparison(ops=20000, seeds=(0, 1, 2), fills=(0.6, 0.8, 0.9)):
+    print("== churn: failure rate / external frag / internal frag (mean over seeds) ==")
+    print(f"{'fill':<6}{'strategy':<16}{'fail %':>9}{'ext frag %':>12}{'int frag %':>12}")
+    for fill in fills:
+        totals = {p: [0.0, 0.0, 0.0] for p in POLICIES}
+        for seed in seeds:
+            trace = simulator.synthetic_trace(ops, seed=seed, fill=fill)
+            for r in simulator.compare(trace, POLICIES):
+                t = totals[r["policy"]]
+                t[0] += r["failure_rate"]
+                t[1] += r["final"]["external_fragmentation"]
+                t[2] += r["final"]["internal_fragmentation"]
+        for p in POLICIES:
+            fail, ext, internal = (v / len(seeds) for v in totals[p])
+            print(f"{fill:<6}{LABELS[p]:<16}{fail:>9.2f}{ext:>12.2f}{internal:>12.2f}")
+
+
+def op_latency(sizes=(1000, 16000, 256000), ops=5000, seed=0):
+    print("\n== per-operation cost vs disk size (microseconds per alloc+free) ==")
+    print(f"{'blocks':<10}{'contiguous':>12}{'buddy':>12}")
+    for total in sizes:
+        rng = random.Random(seed)
+        requests = [rng.randint(1, 64) for _ in range(ops)]
+
+        fit = simulator.FirstFit(total)
+        buddy = BuddyAllocator(total)
+        # fill the disk with 32-block files, then free every other one: both start
+        # from the same checkerboard with half the disk in use. The buddy fill
+        # hands out blocks in free-list order, not from block 0 up, but it takes
+        # every aligned 32-block all the same, so freeing by position matches
+        # the first-fit side even though buddy file fid is not at fid * 32
+        for fid in range(total // 32):
+            fit.allocate(fid, 32)
+            buddy.allocate(32)
+        for fid in range(0, total // 32, 2):
+            fit.free(fid)
+            buddy.free(fid * 32, 5)
+
+        t0 = time.perf_counter()
+        for i, n in enumerate(requests):
+            fid = total + i
+            if fit.allocate(fid, n):
+                fit.free(fid)
+        fit_us = (time.perf_counter() - t0) / ops * 1e6
+
+        t0 = time.perf_counter()
+        for n in requests:
+            block = buddy.allocate(n)
+            if block:
+                buddy.free(*block)
+        buddy_us = (time.perf_counter() - t0) / ops * 1e6
+
+        print(f"{total:<10}{fit_us:>12.2f}{buddy_us:>12.2f}")
+
+
+if __name__ == "__main__":
+    churn_comparison()
+    op_latency()
@@ -0,0 +1,75 @@
+# backend/buddy.py
+"""
+Buddy-system allocator shared by the backend (allocation_type="buddy") and
+the offline simulator.
+
+Blocks are handed out in power-of-two sizes. A request is rounded up to the
+next power of two ("order"), larger free blocks are split in half until one
+of the right order exists, and on free a block is merged with its buddy for
+as long as the buddy is also free. With one free list per order both
+operations are O(log n) in the number of blocks.
+"""
+
+
+class BuddyAllocator:
+    """Power-of-two buddy allocator over [0, total_blocks), with per-order free lists."""
+
+    def __init__(self, total_blocks, free_mask=None):
+        self.total_blocks = total_blocks
+        self.max_order = max(0, total_blocks.bit_length() - 1)
+        self.free_lists = [set() for _ in range(self.max_order + 1)]
+
+        # prefix sums of free blocks, so "is this whole range free" is O(1)
+        free_before = [0]
+        for i in range(total_blocks):
+            free_before.append(free_before[-1] + (1 if free_mask is None or free_mask[i] else 0))
+
+        # a non power-of-two range is covered by the largest aligned blocks that fit
+        start = 0
+        while start < total_blocks:
+            order = self.max_order
+            while start % (1 << order) or start + (1 << order) > total_blocks:
+                order -= 1
+            self._add_free_range(start, order, free_before)
+            start += 1 << order
+
+    def _add_free_range(self, start, order, free_before):
+        size = 1 << order
+        free = free_before[start + size] - free_before[start]
+        if free == size:
+            self.free_lists[order].add(start)
+        elif free and order:
+            half = size >> 1
+            self._add_free_range(start, order - 1, free_before)
+            self._add_free_range(start + half, order - 1, free_before)
+
+    @staticmethod
+    def order_for(num_blocks):
+        return (num_blocks - 1).bit_length()
+
+    def allocate(self, num_blocks):
+        """Return (start, order) of a free block of at least num_blocks, or None."""
+        order = self.order_for(num_blocks)
+        for k in range(order, self.max_order + 1):
+            if self.free_lists[k]:
+                start = self.free_lists[k].pop()
+                # split down, returning the upper halves to the free lists
+                while k > order:
+                    k -= 1
+                    self.free_lists[k].add(start + (1 << k))
+                return start, order
+        return None
+
+    def free(self, start, order):
+        """Release a block and coalesce it with its buddy as far as possible."""
+        while order < self.max_order:
+            buddy = start ^ (1 << order)
+            if buddy not in self.free_lists[order]:
+                break
+            self.free_lists[order].remove(buddy)
+            start = min(start, buddy)
+            order += 1
+        self.free_lists[order].add(start)
+
+    def free_blocks(self):
+        return sum(len(s) << k for k, s in enumerate(self.free_lists))
@@ -0,0 +1,120 @@
+# backend/inference.py
+"""
+Shared inference worker.
+
+Loading MiniLM and Whisper in every web worker multiplies memory and start-up
+time by the worker count. Instead one process owns the models and the web
+workers call into it over a multiprocessing manager socket.
+
+Run it next to the web server:
+    INFERENCE_ADDRESS=127.0.0.1:6000 INFERENCE_AUTHKEY=<secret> python inference.py
+
+Web workers started with the same INFERENCE_ADDRESS and INFERENCE_AUTHKEY
+use the shared worker; without INFERENCE_ADDRESS app.py loads the models
+in-process as before.
+
+The manager protocol is pickle-based, so anyone who can connect and knows
+the key can run code in this process. There is no default key: both sides
+refuse to start without INFERENCE_AUTHKEY.
+"""
+import os
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.managers import BaseManager
+
+
+def get_authkey():
+    key = os.environ.get("INFERENCE_AUTHKEY")
+    if not key:
+        raise RuntimeError("INFERENCE_AUTHKEY must be set to use the shared inference worker")
+    return key.encode()
+
+
+def load_models():
+    import whisper
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer('all-MiniLM-L6-v2')  # your embedding model
+    whisper_model = whisper.load_model("base")       # for MP3 transcription
+    return model, whisper_model
+
+
+def parse_address(address):
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+
+class InferenceUnavailable(Exception):
+    """The shared inference worker could not be reached."""
+
+
+class InferenceManager(BaseManager):
+    pass
+
+
+InferenceManager.register("inference")
+
+
+class InferenceService:
+    """Runs in the worker process. The manager serves each client on its own thread."""
+
+    def __init__(self):
+        self.model, self.whisper_model = load_models()
+        self.lock = threading.Lock()
+
+    def encode(self, text, **kwargs):
+        with self.lock:
+            return self.model.encode(text, **kwargs)
+
+    def transcribe(self, path):
+        with self.lock:
+            return {"text": self.whisper_model.transcribe(path)["text"]}
+
+
+class RemoteModels:
+    """
+    Client side, used by app.py in place of the SentenceTransformer and
+    Whisper objects. Connects lazily so forked web workers each get their
+    own connection.
+    """
+
+    def __init__(self, address):
+        self.address = address
+        self.authkey = get_authkey()
+        self.service = None
+        self.pid = None
+
+    def _service(self):
+        if self.service is None or self.pid != os.getpid():
+            manager = InferenceManager(address=parse_address(self.address), authkey=self.authkey)
+            manager.connect()
+            self.service = manager.inference()
+            self.pid = os.getpid()
+        return self.service
+
+    def _call(self, method, *args, **kwargs):
+        try:
+            return getattr(self._service(), method)(*args, **kwargs)
+        except (OSError, EOFError, AuthenticationError) as e:
+            # reconnect on the next call
+            self.service = None
+            raise InferenceUnavailable(f"inference worker at {self.address}: {e}") from e
+
+    def encode(self, text, **kwargs):
+        return self._call("encode", text, **kwargs)
+
+    def transcribe(self, path):
+        # the worker resolves paths from its own cwd
+        return self._call("transcribe", os.path.abspath(path))
+
+
+def serve(address):
+    authkey = get_authkey()
+    service = InferenceService()
+    InferenceManager.register("inference", callable=lambda: service)
+    manager = InferenceManager(address=parse_address(address), authkey=authkey)
+    print(f"Inference worker listening on {address}")
+    manager.get_server().serve_forever()
+
+
+if __name__ == "__main__":
+    serve(os.environ.get("INFERENCE_ADDRESS", "127.0.0.1:6000"))
@@ -0,0 +1,220 @@
+# backend/loadtest.py
+"""
+Load test for the multi-worker serving mode (wsgi.py).
+
+For each worker count, starts gunicorn on a scratch database and drives a
+mix of GET /files, GET /blocks, POST /upload and DELETE /delete from several
+client processes. The deletes keep the disk churning, so per-worker
+allocator state keeps going stale. Then the clients fill the disk with
+uploads only: a free block handed out twice would be overwritten by its
+second owner and show up below. Finally the database is checked:
+
+ - every acknowledged upload is present and every acknowledged delete is gone
+ - every file owns exactly the blocks its size (or buddy order) requires
+ - no buddy block start was handed out twice
+ - no block belongs to a file that does not exist
+
+Uploads are .bin files, which are not text-indexed, so the inference worker
+is never called and does not need to be running.
+
+Usage:
+    python loadtest.py --workers 1,2,4,8 --duration 15
+"""
+import argparse
+import math
+import multiprocessing
+import os
+import random
+import secrets
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+BLOCK_SIZE_KB = 4
+ALLOCATION_TYPES = ["contiguous", "linked", "indexed", "buddy"]
+MIX = [("files", 0.35), ("blocks", 0.35), ("upload", 0.2), ("delete", 0.1)]
+
+
+def client(args):
+    """One client process: issue requests until the deadline, return its counts and file ids."""
+    base, deadline, seed = args
+    rng = random.Random(seed)
+    session = requests.Session()
+    counts = {name: 0 for name, _ in MIX}
+    errors = 0
+    uploaded, deleted = [], []
+    live = []
+    while time.time() < deadline:
+        op = rng.choices([m[0] for m in MIX], weights=[m[1] for m in MIX])[0]
+        try:
+            if op == "delete":
+                if not live:
+                    continue
+                fid = live.pop(rng.randrange(len(live)))
+                if session.delete(f"{base}/delete/{fid}").status_code != 200:
+                    errors += 1
+                    continue
+                deleted.append(fid)
+            elif op == "upload":
+                body = os.urandom(rng.randint(1, 16) * 1024)
+                r = session.post(f"{base}/upload", files={"file": (f"load_{seed}.bin", body)},
+                                 data={"allocation_type": rng.choice(ALLOCATION_TYPES)})
+                if r.status_code == 200:
+                    uploaded.append(r.json()["file_id"])
+                    live.append(r.json()["file_id"])
+                elif r.status_code == 400 and live:
+                    # disk is full: free one of our own files and count the delete instead
+                    fid = live.pop(rng.randrange(len(live)))
+                    if session.delete(f"{base}/delete/{fid}").status_code == 200:
+                        deleted.append(fid)
+                    else:
+                        errors += 1
+                    continue
+                else:
+                    errors += 1
+                    continue
+            else:
+                r = session.get(f"{base}/{op}")
+                if r.status_code != 200:
+                    errors += 1
+                    continue
+            counts[op] += 1
+        except requests.RequestException:
+            errors += 1
+    return counts, errors, uploaded, deleted
+
+
+def fill(args):
+    """
+    Upload until refused, buddy first: consecutive buddy allocations run on
+    each worker's in-memory free lists without a rebuild in between, so a
+    block wrongly left on them gets handed out. Then fill the rest with
+    single-block linked files.
+    """
+    base, seed = args
+    session = requests.Session()
+    uploaded = []
+    for allocation_type, size_kb in [("buddy", 4), ("linked", 4)]:
+        while True:
+            r = session.post(f"{base}/upload", files={"file": (f"fill_{seed}.bin", b"x" * size_kb * 1024)},
+                             data={"allocation_type": allocation_type})
+            if r.status_code != 200:
+                break
+            uploaded.append(r.json()["file_id"])
+    return uploaded
+
+
+def start_server(workers, port, scratch):
+    env = dict(os.environ,
+               INFERENCE_ADDRESS=os.environ.get("INFERENCE_ADDRESS", "127.0.0.1:6000"),
+               INFERENCE_AUTHKEY=os.environ.get("INFERENCE_AUTHKEY") or secrets.token_hex(16))
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-w", str(workers), "-b", f"127.0.0.1:{port}",
+         "--chdir", scratch, "--pythonpath", BACKEND_DIR, "wsgi:app"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    for _ in range(300):
+        try:
+            if requests.get(f"{base}/files", timeout=1).status_code == 200:
+                return proc, base
+        except requests.RequestException:
+            pass
+        time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError(f"gunicorn with {workers} workers did not start")
+
+
+def verify(db_path, uploaded, deleted):
+    """Return a list of consistency problems found in the database (empty if none)."""
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    c = conn.cursor()
+    problems = []
+
+    files = {r["id"]: r for r in c.execute("SELECT id, size_kb FROM files")}
+    expected_ids = set(uploaded) - set(deleted)
+    if set(files) != expected_ids:
+        problems.append(f"lost files: {sorted(expected_ids - set(files))[:10]}, "
+                        f"unexpected files: {sorted(set(files) - expected_ids)[:10]}")
+
+    buddy_rows = c.execute("SELECT file_id, start_block, block_order FROM buddy_allocations").fetchall()
+    orders = {r["file_id"]: r["block_order"] for r in buddy_rows}
+    starts = [r["start_block"] for r in buddy_rows]
+    if len(starts) != len(set(starts)):
+        problems.append("buddy blocks handed to more than one file")
+    owned = {}
+    for r in c.execute("SELECT file_id, COUNT(*) AS n FROM blocks WHERE file_id IS NOT NULL GROUP BY file_id"):
+        owned[r["file_id"]] = r["n"]
+
+    for fid, row in files.items():
+        need = 1 << orders[fid] if fid in orders else max(1, math.ceil(row["size_kb"] / BLOCK_SIZE_KB))
+        if owned.get(fid, 0) != need:
+            problems.append(f"file {fid} owns {owned.get(fid, 0)} blocks, expected {need}")
+    orphans = set(owned) - set(files)
+    if orphans:
+        problems.append(f"blocks owned by missing files: {sorted(orphans)[:10]}")
+    conn.close()
+    return problems
+
+
+def run(workers, clients, duration, port):
+    scratch = tempfile.mkdtemp(prefix="fs_loadtest_")
+    proc, base = start_server(workers, port, scratch)
+    try:
+        requests.post(f"{base}/init")
+        deadline = time.time() + duration
+        with multiprocessing.Pool(clients) as pool:
+            results = pool.map(client, [(base, deadline, seed) for seed in range(clients)])
+            filled = pool.map(fill, [(base, seed) for seed in range(clients)])
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    counts = {name: sum(r[0][name] for r in results) for name, _ in MIX}
+    errors = sum(r[1] for r in results)
+    uploaded = [fid for r in results for fid in r[2]] + [fid for f in filled for fid in f]
+    deleted = [fid for r in results for fid in r[3]]
+    problems = verify(os.path.join(scratch, "database.db"), uploaded, deleted)
+    shutil.rmtree(scratch, ignore_errors=True)
+    return {
+        "workers": workers,
+        "rps": {name: n / duration for name, n in counts.items()},
+        "total_rps": sum(counts.values()) / duration,
+        "errors": errors,
+        "uploads": len(uploaded),
+        "deletes": len(deleted),
+        "problems": problems,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the multi-worker server.")
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--clients", type=int, default=16, help="client processes")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per worker count")
+    parser.add_argument("--port", type=int, default=5055)
+    args = parser.parse_args()
+
+    print(f"{'workers':<9}{'files/s':>10}{'blocks/s':>10}{'upload/s':>10}{'delete/s':>10}{'total/s':>10}{'speedup':>9}{'errors':>8}  consistency")
+    baseline = None
+    ok = True
+    for workers in [int(w) for w in args.workers.split(",")]:
+        r = run(workers, args.clients, args.duration, args.port)
+        baseline = baseline or r["total_rps"]
+        status = "ok" if not r["problems"] else f"{len(r['problems'])} problems"
+        print(f"{workers:<9}{r['rps']['files']:>10.1f}{r['rps']['blocks']:>10.1f}{r['rps']['upload']:>10.1f}{r['rps']['delete']:>10.1f}"
+              f"{r['total_rps']:>10.1f}{r['total_rps'] / baseline:>9.2f}{r['errors']:>8}  {status}")
+        for problem in r["problems"][:20]:
+            print(f"    {problem}")
+        ok = ok and not r["problems"]
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
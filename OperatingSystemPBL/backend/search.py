@@ -0,0 +1,92 @@
+# backend/search.py
+"""
+Helpers for the /search endpoint.
+
+Keyword search runs on an SQLite FTS5 table maintained by app.py; semantic
+search runs on an in-memory matrix of the MiniLM embeddings cached in the
+database. Both are updated incrementally on upload and delete, so a query
+only encodes the query string itself.
+"""
+import re
+
+import numpy as np
+
+RRF_K = 60  # reciprocal rank fusion constant; damps the weight of top ranks
+
+
+class EmbeddingIndex:
+    """Growable matrix of L2-normalised embeddings keyed by file id."""
+
+    def __init__(self, dim=None):
+        self.dim = dim
+        self.matrix = None
+        self.ids = []
+        self.pos = {}
+
+    def add(self, file_id, vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        if file_id in self.pos:
+            self.matrix[self.pos[file_id]] = vector
+            return
+        if self.matrix is None:
+            self.dim = vector.shape[0]
+            self.matrix = np.empty((64, self.dim), dtype=np.float32)
+        elif len(self.ids) == self.matrix.shape[0]:
+            # double the capacity so appends stay amortised O(1)
+            grown = np.empty((self.matrix.shape[0] * 2, self.dim), dtype=np.float32)
+            grown[:len(self.ids)] = self.matrix[:len(self.ids)]
+            self.matrix = grown
+        self.pos[file_id] = len(self.ids)
+        self.matrix[len(self.ids)] = vector
+        self.ids.append(file_id)
+
+    def remove(self, file_id):
+        i = self.pos.pop(file_id, None)
+        if i is None:
+            return
+        # move the last row into the hole
+        last = len(self.ids) - 1
+        if i != last:
+            self.matrix[i] = self.matrix[last]
+            self.ids[i] = self.ids[last]
+            self.pos[self.ids[i]] = i
+        self.ids.pop()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def vectors(self):
+        return self.matrix[:len(self.ids)] if self.matrix is not None else np.empty((0, 0), dtype=np.float32)
+
+    def top_k(self, query_vector, k):
+        """Return [(file_id, cosine score)] for the k nearest files, best first."""
+        if not self.ids:
+            return []
+        scores = self.vectors() @ np.asarray(query_vector, dtype=np.float32)
+        k = min(k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [(self.ids[i], float(scores[i])) for i in best]
+
+
+def fts_query(text):
+    """Turn free text into an FTS5 query that matches all terms, with no FTS syntax leaking through."""
+    terms = re.findall(r"\w+", text)
+    return " ".join(f'"{t}"' for t in terms)
+
+
+def reciprocal_rank_fusion(*rankings):
+    """Merge ranked lists of file ids into one list of (file_id, fused score), best first."""
+    fused = {}
+    for ranking in rankings:
+        for rank, file_id in enumerate(ranking):
+            fused[file_id] = fused.get(file_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+def to_blob(vector):
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+def from_blob(blob):
+    return np.frombuffer(blob, dtype=np.float32)
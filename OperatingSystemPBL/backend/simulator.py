@@ -0,0 +1,445 @@
+# backend/simulator.py
+"""
+Offline allocation-policy simulator.
+
+Replays a workload trace against several allocation policies at once and
+reports fragmentation curves, failure rates and throughput for each, so the
+policy for a volume can be picked from data instead of guessed.
+
+The disk is modelled as a numpy array of owner ids (one int32 per block) and
+every policy runs in its own process, so a full comparison uses all cores.
+
+Trace format: a list of ops, either ("alloc", file_id, num_blocks) or
+("free", file_id). Traces can be loaded from a JSON file, exported from the
+backend's `files`/`logs` tables, or generated synthetically.
+
+Usage:
+    python simulator.py --db database.db
+    python simulator.py --trace trace.json --policies first-fit,buddy
+    python simulator.py --synthetic 20000 --workers 4 --out results.json
+"""
+import argparse
+import json
+import math
+import os
+import random
+import re
+import sqlite3
+import sys
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from buddy import BuddyAllocator
+
+# ---------- CONFIG ----------
+# keep in sync with app.py
+TOTAL_BLOCKS = 1000
+BLOCK_SIZE_KB = 4
+
+FREE = -1
+RESERVED = -2  # allocated to a policy but holding no file data (internal fragmentation)
+
+SLAB_BLOCKS = 64
+SLAB_CLASSES = [1, 2, 4, 8, 16, 32]
+
+
+# ---------- DISK MODEL ----------
+def free_runs(disk):
+    """Return (starts, lengths) of every run of free blocks, in block order."""
+    free = np.concatenate(([False], disk == FREE, [False]))
+    edges = np.diff(free.astype(np.int8))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    return starts, ends - starts
+
+
+def disk_metrics(disk):
+    """Snapshot of utilization and fragmentation for one disk state."""
+    total = disk.size
+    free_count = int(np.count_nonzero(disk == FREE))
+    reserved = int(np.count_nonzero(disk == RESERVED))
+    used = total - free_count - reserved
+    _, lengths = free_runs(disk)
+    largest = int(lengths.max()) if lengths.size else 0
+    # as fragmentation_percent() in app.py: adjacent blocks owned by different files;
+    # a free block in between resets the comparison. Reserved blocks (buddy tails,
+    # empty slab slots) belong to no file here, so they reset it too.
+    left, right = disk[:-1], disk[1:]
+    boundaries = int(np.count_nonzero((left >= 0) & (right >= 0) & (left != right)))
+    return {
+        "utilization": used / total * 100.0,
+        "external_fragmentation": (1 - largest / free_count) * 100.0 if free_count else 0.0,
+        "internal_fragmentation": reserved / (used + reserved) * 100.0 if used + reserved else 0.0,
+        "fragmentation": boundaries / total * 100.0,
+        "free_runs": int(lengths.size),
+    }
+
+
+# ---------- POLICIES ----------
+class Policy(ABC):
+    """Base policy: owns a disk array and maps file ids to the blocks they hold."""
+    name = None
+
+    def __init__(self, total_blocks):
+        self.disk = np.full(total_blocks, FREE, dtype=np.int32)
+        self.placed = {}
+
+    @abstractmethod
+    def allocate(self, file_id, num_blocks):
+        """Place num_blocks for file_id on the disk; return False if they do not fit."""
+
+    def free(self, file_id):
+        blocks = self.placed.pop(file_id, None)
+        if blocks is None:
+            return False
+        self.disk[blocks] = FREE
+        return True
+
+
+class FitPolicy(Policy):
+    """Contiguous allocation; subclasses choose which free run to use."""
+
+    @abstractmethod
+    def choose(self, starts, lengths, num_blocks):
+        """Return the start block of the free run to use, or None if none fits."""
+
+    def allocate(self, file_id, num_blocks):
+        starts, lengths = free_runs(self.disk)
+        start = self.choose(starts, lengths, num_blocks)
+        if start is None:
+            return False
+        self.disk[start:start + num_blocks] = file_id
+        self.placed[file_id] = np.arange(start, start + num_blocks)
+        return True
+
+
+def first_fit(starts, lengths, num_blocks):
+    fits = np.flatnonzero(lengths >= num_blocks)
+    return int(starts[fits[0]]) if fits.size else None
+
+
+class FirstFit(FitPolicy):
+    name = "first-fit"  # what find_contiguous() does today
+
+    def choose(self, starts, lengths, num_blocks):
+        return first_fit(starts, lengths, num_blocks)
+
+
+class BestFit(FitPolicy):
+    name = "best-fit"
+
+    def choose(self, starts, lengths, num_blocks):
+        fits = np.flatnonzero(lengths >= num_blocks)
+        return int(starts[fits[np.argmin(lengths[fits])]]) if fits.size else None
+
+
+class WorstFit(FitPolicy):
+    name = "worst-fit"
+
+    def choose(self, starts, lengths, num_blocks):
+        if not lengths.size:
+            return None
+        i = int(np.argmax(lengths))
+        return int(starts[i]) if lengths[i] >= num_blocks else None
+
+
+class NextFit(FitPolicy):
+    name = "next-fit"
+
+    def __init__(self, total_blocks):
+        super().__init__(total_blocks)
+        self.cursor = 0
+
+    def choose(self, starts, lengths, num_blocks):
+        # free space after the cursor inside the run that contains it counts too
+        ends = starts + lengths
+        effective = np.maximum(starts, self.cursor)
+        fits = np.flatnonzero((ends - effective) >= num_blocks)
+        if fits.size:
+            start = int(effective[fits[0]])
+        else:
+            fits = np.flatnonzero(lengths >= num_blocks)
+            if not fits.size:
+                return None
+            start = int(starts[fits[0]])
+        self.cursor = (start + num_blocks) % self.disk.size
+        return start
+
+
+class LowestIndex(Policy):
+    name = "lowest-index"  # what find_free_blocks_any() does for linked/indexed
+
+    def allocate(self, file_id, num_blocks):
+        free = np.flatnonzero(self.disk == FREE)[:num_blocks]
+        if free.size < num_blocks:
+            return False
+        self.disk[free] = file_id
+        self.placed[file_id] = free
+        return True
+
+
+class Buddy(Policy):
+    name = "buddy"
+
+    def __init__(self, total_blocks):
+        super().__init__(total_blocks)
+        self.buddy = BuddyAllocator(total_blocks)
+        self.orders = {}
+
+    def allocate(self, file_id, num_blocks):
+        got = self.buddy.allocate(num_blocks)
+        if got is None:
+            return False
+        start, order = got
+        self.disk[start:start + (1 << order)] = RESERVED
+        self.disk[start:start + num_blocks] = file_id
+        self.placed[file_id] = np.arange(start, start + (1 << order))
+        self.orders[file_id] = (start, order)
+        return True
+
+    def free(self, file_id):
+        if not super().free(file_id):
+            return False
+        self.buddy.free(*self.orders.pop(file_id))
+        return True
+
+
+class Slab(Policy):
+    """
+    Slab-by-size-class: small files are rounded up to a size class and packed
+    into SLAB_BLOCKS-sized slabs dedicated to that class; large files fall
+    back to first-fit.
+    """
+    name = "slab"
+
+    def __init__(self, total_blocks):
+        super().__init__(total_blocks)
+        self.slabs = {size: [] for size in SLAB_CLASSES}  # class -> [slab start, free slot offsets]
+        self.owner_slot = {}
+
+    def allocate(self, file_id, num_blocks):
+        size = next((s for s in SLAB_CLASSES if s >= num_blocks), None)
+        if size is None:
+            start = first_fit(*free_runs(self.disk), num_blocks)
+            if start is None:
+                return False
+            self.disk[start:start + num_blocks] = file_id
+            self.placed[file_id] = np.arange(start, start + num_blocks)
+            return True
+
+        slab = next((s for s in self.slabs[size] if s[1]), None)
+        if slab is None:
+            start = first_fit(*free_runs(self.disk), SLAB_BLOCKS)
+            if start is None:
+                return False
+            self.disk[start:start + SLAB_BLOCKS] = RESERVED
+            slab = [start, list(range(SLAB_BLOCKS - size, -1, -size))]
+            self.slabs[size].append(slab)
+
+        offset = slab[1].pop()
+        first = slab[0] + offset
+        self.disk[first:first + num_blocks] = file_id
+        self.placed[file_id] = np.arange(first, first + num_blocks)
+        self.owner_slot[file_id] = (size, slab, offset)
+        return True
+
+    def free(self, file_id):
+        blocks = self.placed.pop(file_id, None)
+        if blocks is None:
+            return False
+        slot = self.owner_slot.pop(file_id, None)
+        if slot is None:
+            self.disk[blocks] = FREE
+            return True
+
+        size, slab, offset = slot
+        self.disk[blocks] = RESERVED
+        slab[1].append(offset)
+        if len(slab[1]) == SLAB_BLOCKS // size:
+            # slab is empty again, hand it back to the disk
+            self.disk[slab[0]:slab[0] + SLAB_BLOCKS] = FREE
+            self.slabs[size].remove(slab)
+        return True
+
+
+POLICIES = {p.name: p for p in (FirstFit, BestFit, WorstFit, NextFit, LowestIndex, Buddy, Slab)}
+
+
+# ---------- TRACES ----------
+def blocks_for(size_kb):
+    return max(1, math.ceil(size_kb / BLOCK_SIZE_KB))
+
+
+def load_trace_file(path):
+    """
+    Load a JSON trace: a list of {"op": "alloc", "file_id": .., "size_kb": ..}
+    (or "num_blocks") and {"op": "free", "file_id": ..} objects.
+    """
+    with open(path) as f:
+        entries = json.load(f)
+    trace = []
+    for e in entries:
+        if e["op"] == "alloc":
+            n = e["num_blocks"] if "num_blocks" in e else blocks_for(e["size_kb"])
+            trace.append(("alloc", int(e["file_id"]), int(n)))
+        elif e["op"] == "free":
+            trace.append(("free", int(e["file_id"])))
+    return trace
+
+
+def load_trace_from_db(db_path):
+    """
+    Export a trace from the backend database by replaying the `logs` journal.
+
+    upload() journals "Uploaded file '..' (id N, B blocks) ..." and
+    delete_file() journals "Deleted file with id N", so uploads and deletes
+    replay in the order they happened. Files uploaded before the journal
+    recorded block counts are taken from `files` (sizes survive only for
+    files that still exist) and placed first; deletes of such older files
+    that are already gone cannot be replayed and are reported on stderr.
+    """
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    c = conn.cursor()
+    journal = []
+    journaled = set()
+    unmatched = 0
+    c.execute("SELECT action FROM logs ORDER BY id")
+    for r in c.fetchall():
+        m = re.match(r"Uploaded file .* \(id (\d+), (\d+) blocks\)", r["action"])
+        if m:
+            journal.append(("alloc", int(m.group(1)), int(m.group(2))))
+            journaled.add(int(m.group(1)))
+            continue
+        m = re.match(r"Deleted file with id (\d+)", r["action"])
+        if m:
+            journal.append(("free", int(m.group(1))))
+
+    c.execute("SELECT id, size_kb FROM files ORDER BY id")
+    trace = [("alloc", r["id"], blocks_for(r["size_kb"])) for r in c.fetchall() if r["id"] not in journaled]
+    conn.close()
+
+    allocated = {op[1] for op in trace}
+    for op in journal:
+        if op[0] == "alloc":
+            allocated.add(op[1])
+        elif op[1] not in allocated:
+            unmatched += 1
+            continue
+        trace.append(op)
+    if unmatched:
+        print(f"warning: {unmatched} deletes refer to uploads with no recorded size and were dropped; "
+              "the trace under-represents churn", file=sys.stderr)
+    return trace
+
+
+def synthetic_trace(num_ops, total_blocks=TOTAL_BLOCKS, seed=0, max_kb=256, fill=0.8):
+    """
+    Churn workload: allocate until the disk is about `fill` full, then mix
+    random frees and allocations. Sizes are log-uniform up to max_kb.
+    """
+    rng = random.Random(seed)
+    trace = []
+    live = []
+    used = 0
+    next_id = 1
+    for _ in range(num_ops):
+        if live and (used >= fill * total_blocks or rng.random() < 0.4):
+            fid, n = live.pop(rng.randrange(len(live)))
+            used -= n
+            trace.append(("free", fid))
+        else:
+            n = blocks_for(math.exp(rng.uniform(0, math.log(max_kb))))
+            live.append((next_id, n))
+            used += n
+            trace.append(("alloc", next_id, n))
+            next_id += 1
+    return trace
+
+
+# ---------- RUNNER ----------
+def run_policy(name, trace, total_blocks=TOTAL_BLOCKS, sample_every=None):
+    """Replay a trace against one policy. Runs inside a worker process."""
+    policy = POLICIES[name](total_blocks)
+    sample_every = sample_every or max(1, len(trace) // 200)
+    allocs = failures = 0
+    failed = set()
+    curve = []
+    elapsed = 0.0
+    for i, op in enumerate(trace):
+        t0 = time.perf_counter()
+        if op[0] == "alloc":
+            allocs += 1
+            if not policy.allocate(op[1], op[2]):
+                failures += 1
+                failed.add(op[1])
+        elif op[1] not in failed:
+            policy.free(op[1])
+        elapsed += time.perf_counter() - t0
+        if i % sample_every == 0 or i == len(trace) - 1:
+            curve.append({"op": i, **disk_metrics(policy.disk)})
+    return {
+        "policy": name,
+        "ops": len(trace),
+        "allocations": allocs,
+        "failures": failures,
+        "failure_rate": failures / allocs * 100.0 if allocs else 0.0,
+        "ops_per_sec": len(trace) / elapsed if elapsed else 0.0,
+        "final": disk_metrics(policy.disk),
+        "curve": curve,
+    }
+
+
+def compare(trace, policies=None, total_blocks=TOTAL_BLOCKS, workers=None, sample_every=None):
+    """Run every policy over the same trace in parallel, one process per policy."""
+    policies = policies or list(POLICIES)
+    with ProcessPoolExecutor(max_workers=workers or min(len(policies), os.cpu_count() or 1)) as pool:
+        futures = [pool.submit(run_policy, p, trace, total_blocks, sample_every) for p in policies]
+        return [f.result() for f in futures]
+
+
+def print_summary(results):
+    print(f"{'policy':<14}{'fail %':>9}{'ext frag %':>12}{'int frag %':>12}{'util %':>9}{'ops/s':>12}")
+    for r in sorted(results, key=lambda r: (r["failure_rate"], r["final"]["external_fragmentation"])):
+        f = r["final"]
+        print(f"{r['policy']:<14}{r['failure_rate']:>9.2f}{f['external_fragmentation']:>12.2f}"
+              f"{f['internal_fragmentation']:>12.2f}{f['utilization']:>9.2f}{r['ops_per_sec']:>12.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare allocation policies on a workload trace.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--trace", help="JSON trace file")
+    source.add_argument("--db", help="backend database to export a trace from")
+    source.add_argument("--synthetic", type=int, metavar="OPS", help="generate a churn trace of OPS operations")
+    parser.add_argument("--policies", help="comma-separated subset of: " + ", ".join(POLICIES))
+    parser.add_argument("--blocks", type=int, default=TOTAL_BLOCKS)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write full results (including curves) as JSON")
+    args = parser.parse_args()
+
+    if args.trace:
+        trace = load_trace_file(args.trace)
+    elif args.db:
+        trace = load_trace_from_db(args.db)
+    else:
+        trace = synthetic_trace(args.synthetic, args.blocks, seed=args.seed)
+
+    policies = args.policies.split(",") if args.policies else None
+    unknown = set(policies or []) - set(POLICIES)
+    if unknown:
+        parser.error(f"unknown policies: {', '.join(sorted(unknown))}")
+
+    results = compare(trace, policies, args.blocks, args.workers)
+    print_summary(results)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+# backend/tests/conftest.py
+import importlib
+import io
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+@pytest.fixture
+def app_module(tmp_path, monkeypatch):
+    """A fresh import of app.py on an empty database in tmp_path, with no models loaded."""
+    monkeypatch.chdir(tmp_path)
+    # nothing listens here: tests must not need the inference worker
+    monkeypatch.setenv("INFERENCE_ADDRESS", "127.0.0.1:1")
+    monkeypatch.setenv("INFERENCE_AUTHKEY", "test")
+    sys.modules.pop("app", None)
+    module = importlib.import_module("app")
+    yield module
+    sys.modules.pop("app", None)
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+def upload(client, size_kb, allocation_type, name="f.bin"):
+    return client.post("/upload", data={
+        "file": (io.BytesIO(b"x" * int(size_kb * 1024)), name),
+        "allocation_type": allocation_type,
+    }, content_type="multipart/form-data")
@@ -0,0 +1,32 @@
+# backend/tests/test_allocation.py
+from conftest import upload
+
+
+def owned_blocks(app_module):
+    conn = app_module.get_conn()
+    rows = conn.execute("SELECT file_id, COUNT(*) AS n FROM blocks WHERE file_id IS NOT NULL GROUP BY file_id").fetchall()
+    conn.close()
+    return {r["file_id"]: r["n"] for r in rows}
+
+
+def test_delete_buddy_file_with_stale_allocator_does_not_double_free(app_module, client):
+    buddy = upload(client, 10, "buddy").get_json()
+    # a non-buddy upload leaves this worker's buddy free lists stale
+    assert upload(client, 4, "contiguous").status_code == 200
+    assert client.delete(f"/delete/{buddy['file_id']}").status_code == 200
+
+    with app_module.allocation_lock() as conn:
+        free_in_table = conn.execute("SELECT COUNT(*) AS n FROM blocks WHERE file_id IS NULL").fetchone()["n"]
+        assert app_module.get_buddy_allocator(conn).free_blocks() == free_in_table
+
+    # fill the disk with single-block buddy files: no block may be handed out twice
+    while upload(client, 4, "buddy").status_code == 200:
+        pass
+    owned = owned_blocks(app_module)
+    assert all(n == 1 for fid, n in owned.items() if fid != 2)
+    conn = app_module.get_conn()
+    starts = [r["start_block"] for r in conn.execute("SELECT start_block FROM buddy_allocations")]
+    files = conn.execute("SELECT COUNT(*) AS n FROM files").fetchone()["n"]
+    conn.close()
+    assert len(starts) == len(set(starts))
+    assert sum(owned.values()) == files == app_module.TOTAL_BLOCKS
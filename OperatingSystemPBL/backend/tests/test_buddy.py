@@ -0,0 +1,81 @@
+# backend/tests/test_buddy.py
+import random
+
+import pytest
+
+from buddy import BuddyAllocator
+from conftest import upload
+
+
+def snapshot(allocator):
+    return [sorted(s) for s in allocator.free_lists]
+
+
+def test_split_takes_the_smallest_block_that_fits():
+    allocator = BuddyAllocator(1000)
+    # 1000 = 512 + 256 + 128 + 64 + 32 + 8: the smallest top-level block is 8 at 992
+    assert allocator.allocate(1) == (992, 0)
+    assert allocator.free_lists[2] == {996}
+    assert allocator.free_lists[1] == {994}
+    assert allocator.free_lists[0] == {993}
+    assert allocator.free_blocks() == 999
+
+
+def test_freeing_everything_coalesces_back_to_initial_free_lists():
+    allocator = BuddyAllocator(1000)
+    initial = snapshot(allocator)
+    rng = random.Random(0)
+    held = []
+    while True:
+        block = allocator.allocate(rng.randint(1, 40))
+        if block is None:
+            break
+        held.append(block)
+    assert len(held) > 10
+    rng.shuffle(held)
+    for start, order in held:
+        allocator.free(start, order)
+    assert snapshot(allocator) == initial
+    assert allocator.free_blocks() == 1000
+
+
+def test_blocks_flags_the_unused_tail_of_a_buddy_block(client):
+    # 10 KB = 3 blocks, rounded up to a 4-block buddy
+    file_id = upload(client, 10, "buddy").get_json()["file_id"]
+    owned = [b for b in client.get("/blocks").get_json()["blocks"] if b["file_id"] == file_id]
+    assert [b["internal_fragment"] for b in owned] == [False, False, False, True]
+
+
+def test_fragmentation_reports_internal_fragmentation(client):
+    upload(client, 10, "buddy")   # 3 of 4 blocks used
+    upload(client, 20, "buddy")   # 5 of 8 blocks used
+    upload(client, 8, "linked")   # no internal fragmentation
+    internal = client.get("/fragmentation").get_json()["internal_fragmentation"]
+    assert internal["wasted_blocks"] == 4
+    assert internal["percent"] == pytest.approx(4 / 12 * 100)
+
+
+def test_defragment_keeps_buddy_blocks_aligned(app_module, client):
+    ids = []
+    for size_kb, allocation_type in [(4, "buddy"), (8, "contiguous"), (20, "buddy"), (12, "linked"),
+                                     (60, "buddy"), (8, "buddy"), (4, "indexed")]:
+        ids.append(upload(client, size_kb, allocation_type).get_json()["file_id"])
+    client.delete(f"/delete/{ids[0]}")
+    client.delete(f"/delete/{ids[1]}")
+
+    assert client.post("/defragment").status_code == 200
+
+    conn = app_module.get_conn()
+    rows = conn.execute("SELECT file_id, start_block, block_order FROM buddy_allocations").fetchall()
+    owners = {r["block_index"]: r["file_id"] for r in conn.execute("SELECT block_index, file_id FROM blocks")}
+    conn.close()
+    assert len(rows) == 3
+    for r in rows:
+        size = 1 << r["block_order"]
+        assert r["start_block"] % size == 0
+        assert all(owners[b] == r["file_id"] for b in range(r["start_block"], r["start_block"] + size))
+
+    # the rebuilt free lists agree with the table
+    with app_module.allocation_lock() as conn:
+        free_in_table = conn.execute("SELECT COUNT(*) AS n FROM blocks WHERE file_id IS NULL").fetchone()["n"]
+        assert app_module.get_buddy_allocator(conn).free_blocks() == free_in_table
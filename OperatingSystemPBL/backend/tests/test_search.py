@@ -0,0 +1,47 @@
+# backend/tests/test_search.py
+from conftest import upload
+
+
+def test_search_rejects_limit_below_one(client):
+    r = client.get("/search", query_string={"q": "fox", "mode": "keyword", "limit": -5})
+    assert r.status_code == 400
+
+
+def test_backfill_indexes_files_missing_from_index_outside_search(app_module, client):
+    file_id = upload(client, 1, "linked", name="notes.bin").get_json()["file_id"]
+    # as if uploaded before the search index existed
+    conn = app_module.get_conn()
+    conn.execute("DELETE FROM file_text WHERE rowid = ?", (file_id,))
+    conn.commit()
+    conn.close()
+
+    # /search never extracts; the file waits for the backfill thread
+    r = client.get("/search", query_string={"q": "notes", "mode": "keyword"})
+    assert r.get_json()["results"] == []
+
+    app_module.backfill_search_index()
+    r = client.get("/search", query_string={"q": "notes", "mode": "keyword"})
+    assert [hit["file_id"] for hit in r.get_json()["results"]] == [file_id]
+
+
+def test_backfill_lease_is_held_by_one_worker_at_a_time(app_module):
+    assert app_module.claim_lease("search_backfill", 60)
+    conn = app_module.get_conn()
+    conn.execute("UPDATE leases SET owner = -1 WHERE name = 'search_backfill'")
+    conn.commit()
+    conn.close()
+    assert not app_module.claim_lease("search_backfill", 60)
+
+
+def test_index_file_skips_files_deleted_since_upload(app_module, client, tmp_path):
+    file_id = upload(client, 1, "linked", name="notes.txt").get_json()["file_id"]
+    client.delete(f"/delete/{file_id}")
+    # indexing that started before the delete finishes after it
+    path = tmp_path / "notes.txt"
+    path.write_text("late notes")
+    app_module.index_file(file_id, "notes.txt", str(path))
+
+    conn = app_module.get_conn()
+    leftover = conn.execute("SELECT COUNT(*) AS n FROM file_text").fetchone()["n"]
+    conn.close()
+    assert leftover == 0
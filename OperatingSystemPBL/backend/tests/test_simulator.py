@@ -0,0 +1,101 @@
+# backend/tests/test_simulator.py
+import numpy as np
+import pytest
+
+import simulator
+from conftest import upload
+
+
+def test_journal_replays_as_simulator_trace(app_module, client):
+    ids = [upload(client, 8, "linked", name=f"f{i}.bin").get_json()["file_id"] for i in range(4)]
+    client.delete(f"/delete/{ids[1]}")
+
+    assert simulator.load_trace_from_db(app_module.DB_FILE) == [
+        ("alloc", ids[0], 2), ("alloc", ids[1], 2), ("alloc", ids[2], 2), ("alloc", ids[3], 2), ("free", ids[1]),
+    ]
+
+
+def test_fragmentation_matches_app_definition():
+    disk = np.array([1, simulator.FREE, 2], dtype=np.int32)
+    assert simulator.disk_metrics(disk)["fragmentation"] == 0.0
+    disk = np.array([1, 2, simulator.FREE, 2, 3], dtype=np.int32)
+    assert simulator.disk_metrics(disk)["fragmentation"] == 2 / 5 * 100.0
+
+
+def holes():
+    """11 blocks, free runs of 3, 2 and 4 blocks at 0, 4 and 7."""
+    F = simulator.FREE
+    return np.array([F, F, F, 9, F, F, 9, F, F, F, F], dtype=np.int32)
+
+
+def place(policy_class, num_blocks):
+    policy = policy_class(11)
+    policy.disk[:] = holes()
+    assert policy.allocate(1, num_blocks)
+    return int(policy.placed[1][0])
+
+
+def test_fit_policies_pick_their_run():
+    assert place(simulator.FirstFit, 2) == 0
+    assert place(simulator.BestFit, 2) == 4
+    assert place(simulator.WorstFit, 2) == 7
+    assert not simulator.WorstFit(11).allocate(1, 12)
+
+
+def test_next_fit_continues_from_cursor_and_wraps():
+    policy = simulator.NextFit(10)
+    assert policy.allocate(1, 2) and policy.allocate(2, 2)
+    policy.free(1)
+    # first-fit would reuse block 0
+    assert policy.allocate(3, 1) and policy.placed[3][0] == 4
+    assert policy.allocate(4, 5) and policy.placed[4][0] == 5
+    # nothing fits after the cursor (block 10 -> 0), so it wraps to the start
+    assert policy.allocate(5, 2) and policy.placed[5][0] == 0
+    assert policy.cursor == 2
+
+
+def test_buddy_reserves_the_tail_of_its_block():
+    policy = simulator.Buddy(16)
+    assert policy.allocate(1, 3)
+    start = int(policy.placed[1][0])
+    assert start % 4 == 0
+    assert list(policy.disk[start:start + 4]) == [1, 1, 1, simulator.RESERVED]
+    assert simulator.disk_metrics(policy.disk)["internal_fragmentation"] == 25.0
+    policy.free(1)
+    assert (policy.disk == simulator.FREE).all()
+    assert policy.buddy.free_blocks() == 16
+
+
+def test_slab_returns_empty_slab_to_free():
+    policy = simulator.Slab(128)
+    assert policy.allocate(1, 1) and policy.allocate(2, 1)
+    assert policy.disk[0] == 1 and policy.disk[1] == 2
+    assert (policy.disk[2:simulator.SLAB_BLOCKS] == simulator.RESERVED).all()
+    # files larger than the biggest class bypass the slabs
+    assert policy.allocate(3, 40) and policy.placed[3][0] == simulator.SLAB_BLOCKS
+
+    policy.free(1)
+    assert policy.disk[0] == simulator.RESERVED
+    policy.free(2)
+    assert (policy.disk[:simulator.SLAB_BLOCKS] == simulator.FREE).all()
+    assert policy.slabs[1] == []
+
+
+def test_run_policy_counts_failures_and_skips_their_frees():
+    trace = [("alloc", 1, 3), ("alloc", 2, 2), ("free", 2), ("free", 1), ("alloc", 3, 4)]
+    r = simulator.run_policy("first-fit", trace, total_blocks=4, sample_every=1)
+    assert (r["ops"], r["allocations"], r["failures"]) == (5, 3, 1)
+    assert r["failure_rate"] == pytest.approx(100 / 3)
+    assert r["ops_per_sec"] > 0
+    assert r["final"]["utilization"] == 100.0
+    assert [point["op"] for point in r["curve"]] == [0, 1, 2, 3, 4]
+
+
+def test_compare_returns_one_result_per_policy():
+    trace = simulator.synthetic_trace(200, total_blocks=128, seed=1)
+    policies = ["first-fit", "buddy", "slab"]
+    results = simulator.compare(trace, policies, total_blocks=128, workers=1)
+    assert [r["policy"] for r in results] == policies
+    for r in results:
+        assert r["ops"] == len(trace)
+        assert r["curve"] and r["curve"][-1]["op"] == len(trace) - 1
@@ -0,0 +1,34 @@
+# backend/tests/test_upload.py
+import pytest
+
+from conftest import upload
+from inference import RemoteModels
+
+
+def test_upload_succeeds_when_inference_worker_is_down(app_module, client):
+    # .txt content needs model.encode, and nothing listens on INFERENCE_ADDRESS
+    r = upload(client, 1, "linked", name="notes.txt")
+    assert r.status_code == 200
+    file_id = r.get_json()["file_id"]
+
+    conn = app_module.get_conn()
+    files = conn.execute("SELECT COUNT(*) AS n FROM files").fetchone()["n"]
+    indexed = conn.execute("SELECT COUNT(*) AS n FROM file_text").fetchone()["n"]
+    conn.close()
+    # committed exactly once; indexing happens off the request
+    assert files == 1
+    assert indexed == 0
+
+    # keyword search does not need the inference worker, only the embedding waits
+    app_module.backfill_search_index()
+    r = client.get("/search", query_string={"q": "notes", "mode": "keyword"})
+    assert [hit["file_id"] for hit in r.get_json()["results"]] == [file_id]
+    conn = app_module.get_conn()
+    assert conn.execute("SELECT COUNT(*) AS n FROM file_embeddings").fetchone()["n"] == 0
+    conn.close()
+
+
+def test_remote_models_require_authkey(monkeypatch):
+    monkeypatch.delenv("INFERENCE_AUTHKEY", raising=False)
+    with pytest.raises(RuntimeError):
+        RemoteModels("127.0.0.1:6000")
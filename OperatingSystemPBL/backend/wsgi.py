@@ -0,0 +1,28 @@
+# backend/wsgi.py
+"""
+Production entry point.
+
+    export INFERENCE_ADDRESS=127.0.0.1:6000 INFERENCE_AUTHKEY=<secret>
+
+    # one process owns the models
+    python inference.py &
+
+    # N web workers share the SQLite state and call into the inference worker
+    gunicorn -w 4 -b 0.0.0.0:5000 wsgi:app
+
+Block allocation is coordinated through SQLite: every allocation, delete,
+defragment and reset runs in a BEGIN IMMEDIATE transaction (see
+allocation_lock() in app.py), so workers never hand out the same block.
+
+Uploads are indexed for /search off the request, so a long Whisper
+transcription cannot run into gunicorn's worker timeout (30 s by default)
+after the file is committed. Each worker runs the search index backfill
+thread that does it; a lease in the database lets only one of them extract
+and encode at a time.
+"""
+from app import app, start_search_backfill
+
+start_search_backfill()
+
+if __name__ == "__main__":
+    app.run(host="0.0.0.0", port=5000)
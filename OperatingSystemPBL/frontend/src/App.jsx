@@ -356,6 +356,7 @@ const FileSystemSimulator = () => {
     if (file.allocation_type === "contiguous") return "contiguous";
     if (file.allocation_type === "linked") return "linked";
     if (file.allocation_type === "indexed") return "indexed";
+    if (file.allocation_type === "buddy") return "buddy";
 
     return "neutral";
   };
@@ -364,12 +365,14 @@ const FileSystemSimulator = () => {
     contiguous: files.filter(f => f.allocation_type === "contiguous").length,
     linked: files.filter(f => f.allocation_type === "linked").length,
     indexed: files.filter(f => f.allocation_type === "indexed").length,
+    buddy: files.filter(f => f.allocation_type === "buddy").length,
   };
 
   const allocationData = [
     { name: "Contiguous", value: allocationStats.contiguous, color: "#3b82f6" },
     { name: "Linked", value: allocationStats.linked, color: "#eab308" },
-    { name: "Indexed", value: allocationStats.indexed, color: "#f97316" }
+    { name: "Indexed", value: allocationStats.indexed, color: "#f97316" },
+    { name: "Buddy", value: allocationStats.buddy, color: "#14b8a6" }
   ];
 
   return (
@@ -551,7 +554,7 @@ const FileSystemSimulator = () => {
             </div>
 
             <div className="flex flex-wrap gap-2 mb-4">
-              {['contiguous', 'linked', 'indexed'].map(type => (
+              {['contiguous', 'linked', 'indexed', 'buddy'].map(type => (
                 <button
                   key={type}
                   onClick={() => setSelectedAllocation(type)}
@@ -574,6 +577,7 @@ const FileSystemSimulator = () => {
                 {selectedAllocation === 'contiguous' && 'Files stored in continuous blocks'}
                 {selectedAllocation === 'linked' && 'Blocks linked via pointers'}
                 {selectedAllocation === 'indexed' && 'Index block contains addresses'}
+                {selectedAllocation === 'buddy' && 'Power-of-two blocks split and merged with their buddy'}
               </p>
             </div>
 
@@ -692,6 +696,7 @@ const FileSystemSimulator = () => {
                 contiguous: '#3b82f6',
                 linked: '#eab308',
                 indexed: '#f97316',
+                buddy: '#14b8a6',
                 duplicate: '#a855f7',
                 junk: '#ef4444',
                 neutral: '#64748b'
@@ -925,6 +930,7 @@ const FileSystemSimulator = () => {
                           <div className="flex flex-wrap gap-2 text-xs">
                             <span className={`px-2 py-0.5 rounded ${file.allocation_type === 'contiguous' ? 'bg-blue-500/20 text-blue-400' :
                                 file.allocation_type === 'linked' ? 'bg-yellow-500/20 text-yellow-400' :
+                                file.allocation_type === 'buddy' ? 'bg-teal-500/20 text-teal-400' :
                                   'bg-orange-500/20 text-orange-400'
                               }`}>
                               {file.allocation_type}
@@ -1229,6 +1235,7 @@ const FileSystemSimulator = () => {
                 <option value="contiguous">Contiguous - Continuous blocks</option>
                 <option value="linked">Linked - Blocks with pointers</option>
                 <option value="indexed">Indexed - Index block addresses</option>
+                <option value="buddy">Buddy - Power-of-two split/merge</option>
               </select>
             </div>
 